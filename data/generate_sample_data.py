@@ -1,14 +1,22 @@
 """
 Sample data generator for training and testing
+
+Data is written as a binary .npy array by default. Consumers can share it
+across processes without copying via np.load("sample_data.npy", mmap_mode="r").
 """
 
-import pandas as pd
+import argparse
+
 import numpy as np
 from sklearn.datasets import make_classification
 
 
 def generate_sample_data(n_samples=1000, n_features=10, n_classes=2, random_state=42):
-    """Generate sample classification data"""
+    """Generate sample classification data
+
+    Returns a float32 array of shape (n_samples, n_features + 1) whose last
+    column is the target.
+    """
     X, y = make_classification(
         n_samples=n_samples,
         n_features=n_features,
@@ -17,23 +25,36 @@ def generate_sample_data(n_samples=1000, n_features=10, n_classes=2, random_stat
         n_classes=n_classes,
         random_state=random_state
     )
-    
-    # Create feature names
-    feature_names = [f'feature_{i}' for i in range(n_features)]
-    
-    # Create DataFrame
-    df = pd.DataFrame(X, columns=feature_names)
-    df['target'] = y
-    
-    return df
+
+    # Features are float32 to match what the API feeds models
+    data = np.empty((n_samples, n_features + 1), dtype=np.float32)
+    data[:, :-1] = X
+    data[:, -1] = y
+
+    return data
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate sample training data')
+    parser.add_argument('--format', choices=['npy', 'csv'], default='npy', help='Output format')
+    args = parser.parse_args()
+
     # Generate sample data
-    df = generate_sample_data()
-    
-    # Save to CSV
-    df.to_csv('sample_data.csv', index=False)
-    print(f"Generated sample data with shape: {df.shape}")
-    print(f"Features: {df.columns.tolist()[:-1]}")
-    print(f"Target distribution: {df['target'].value_counts().to_dict()}")
+    data = generate_sample_data()
+    feature_names = [f'feature_{i}' for i in range(data.shape[1] - 1)]
+
+    if args.format == 'csv':
+        np.savetxt(
+            'sample_data.csv', data,
+            delimiter=',',
+            header=','.join(feature_names + ['target']),
+            comments='',
+            fmt=['%.8g'] * len(feature_names) + ['%d']
+        )
+    else:
+        np.save('sample_data.npy', data)
+
+    classes, counts = np.unique(data[:, -1], return_counts=True)
+    print(f"Generated sample data with shape: {data.shape}")
+    print(f"Features: {feature_names}")
+    print(f"Target distribution: {dict(zip(classes.astype(int).tolist(), counts.tolist()))}")
@@ -0,0 +1,141 @@
+"""
+Server-side micro-batching for ML API service
+Coalesces concurrent single-row predictions into one model call per batch
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import structlog
+
+logger = structlog.get_logger()
+
+
+class MicroBatcher:
+    """Collects rows per model for up to max_delay_ms and predicts them together"""
+    
+    def __init__(self, max_batch_size: int = 32, max_delay_ms: float = 2.0, idle_timeout: float = 60.0):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        # Workers for models that stop receiving traffic (unloaded, evicted)
+        # exit after this many idle seconds; the next submit starts a new one
+        self.idle_timeout = idle_timeout
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._closed = False
+    
+    async def submit(
+        self,
+        model_name: str,
+        model_info: Dict[str, Any],
+        row: np.ndarray
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Queue one feature row and wait for its (prediction, probabilities)"""
+        if self._closed:
+            raise RuntimeError("Micro-batcher is shut down")
+        
+        queue = self._queues.get(model_name)
+        if queue is None:
+            queue = self._queues[model_name] = asyncio.Queue()
+            self._tasks[model_name] = asyncio.create_task(self._worker(model_name, queue))
+        
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((model_info, row, future))
+        return await future
+    
+    async def _worker(self, model_name: str, queue: asyncio.Queue):
+        """Wait for a first row, then gather more until the batch is full or the delay expires"""
+        loop = asyncio.get_running_loop()
+        items: List[Tuple[Dict[str, Any], np.ndarray, asyncio.Future]] = []
+        try:
+            while True:
+                items = []
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), self.idle_timeout))
+                except asyncio.TimeoutError:
+                    # Nothing can be queued between this check and the
+                    # removal, since neither yields to the event loop
+                    if queue.empty():
+                        del self._queues[model_name]
+                        del self._tasks[model_name]
+                        return
+                    continue
+                deadline = loop.time() + self.max_delay
+                while len(items) < self.max_batch_size:
+                    if not queue.empty():
+                        items.append(queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        items.append(await asyncio.wait_for(queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                
+                # A reload can swap the model while rows are queued; only rows
+                # submitted against the same model object share a call
+                groups: Dict[int, List[Tuple[Dict[str, Any], np.ndarray, asyncio.Future]]] = {}
+                for item in items:
+                    groups.setdefault(id(item[0]), []).append(item)
+                for group in groups.values():
+                    # Score off the event loop so requests keep being accepted
+                    # and queued while the model runs; futures are resolved
+                    # back here, on the loop
+                    try:
+                        prediction, probabilities = await loop.run_in_executor(None, self._predict, group)
+                    except Exception as e:
+                        self._fail(group, e)
+                        continue
+                    self._resolve(group, prediction, probabilities)
+        except asyncio.CancelledError:
+            # Rows being gathered or scored would otherwise never be answered
+            self._fail(items, RuntimeError("Micro-batcher is shut down"))
+            raise
+    
+    @staticmethod
+    def _predict(
+        group: List[Tuple[Dict[str, Any], np.ndarray, asyncio.Future]]
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Predict a group of rows with one model call"""
+        features = np.stack([row for _, row, _ in group])
+        return group[0][0]["predict_with_proba"](features)
+    
+    @staticmethod
+    def _resolve(
+        group: List[Tuple[Dict[str, Any], np.ndarray, asyncio.Future]],
+        prediction: np.ndarray,
+        probabilities: Optional[np.ndarray]
+    ):
+        """Hand each caller its own row of the group's outputs"""
+        for i, (_, _, future) in enumerate(group):
+            if not future.done():
+                future.set_result((
+                    prediction[i:i + 1],
+                    probabilities[i] if probabilities is not None else None
+                ))
+    
+    @staticmethod
+    def _fail(items: List[Tuple[Dict[str, Any], np.ndarray, asyncio.Future]], error: Exception):
+        """Fail every unanswered future in items with error"""
+        for _, _, future in items:
+            if not future.done():
+                future.set_exception(error)
+    
+    async def close(self):
+        """Stop all batching workers, failing any rows still waiting"""
+        self._closed = True
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        
+        for queue in self._queues.values():
+            while not queue.empty():
+                _, _, future = queue.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError("Micro-batcher is shut down"))
+        self._tasks.clear()
+        self._queues.clear()
+        logger.info("Micro-batcher stopped")
@@ -0,0 +1,59 @@
+"""
+Prediction caching for ML API service
+Keeps model outputs for recently seen feature vectors in an in-process LRU
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+
+class PredictionCache:
+    """LRU cache of model outputs keyed by a hash of the input features"""
+    
+    def __init__(self, max_size: int = 10240):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[np.ndarray, Optional[np.ndarray]]]" = OrderedDict()
+    
+    @staticmethod
+    def make_key(model_name: str, model_info: Dict[str, Any], features: np.ndarray) -> Tuple:
+        """Build a cache key for a model and its input features"""
+        digest = hashlib.blake2b(
+            np.ascontiguousarray(features, dtype=np.float32).tobytes(),
+            digest_size=16
+        ).digest()
+        # loaded_at changes on every reload, so stale outputs are never served
+        return (model_name, model_info.get("version"), model_info.get("loaded_at"), digest)
+    
+    def get(self, key: Hashable) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """Get cached (prediction, probabilities), or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+    
+    def put(self, key: Hashable, prediction: np.ndarray, probabilities: Optional[np.ndarray]):
+        """Store model outputs, evicting the least recently used entries
+        
+        Outputs are copied: they are often row views of a whole batch's
+        output, which a cached view would keep alive.
+        """
+        if self.max_size <= 0:
+            return
+        
+        self._entries[key] = (
+            prediction.copy(),
+            probabilities.copy() if probabilities is not None else None
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached outputs"""
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
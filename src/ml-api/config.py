@@ -3,57 +3,83 @@ Configuration management for ML API service
 """
 
 import os
-from typing import List, Optional
-from pydantic_settings import BaseSettings
-from pydantic import Field
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
 
+try:
+    from dotenv import load_dotenv
+except ImportError:  # python-dotenv is optional; the process environment still applies
+    load_dotenv = None
+
+if load_dotenv is not None:
+    load_dotenv(".env", encoding="utf-8")
+
+
+def _env(name: str, default: Any = None, cast: Callable[[str], Any] = str) -> Any:
+    """Field factory reading an environment variable once, at construction"""
+    def factory():
+        value = os.environ.get(name)
+        if value is None or value == "":
+            return default
+        return cast(value)
+    return field(default_factory=factory)
+
+
+def _to_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _to_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Application settings read from environment variables"""
 
-class Settings(BaseSettings):
-    """Application settings using Pydantic BaseSettings"""
-    
     # Application settings
-    app_name: str = Field(default="ML Pipeline API", env="APP_NAME")
-    version: str = Field(default="1.0.0", env="APP_VERSION")
-    environment: str = Field(default="development", env="ENVIRONMENT")
-    debug: bool = Field(default=False, env="DEBUG")
-    
+    app_name: str = _env("APP_NAME", "ML Pipeline API")
+    version: str = _env("APP_VERSION", "1.0.0")
+    environment: str = _env("ENVIRONMENT", "development")
+    debug: bool = _env("DEBUG", False, _to_bool)
+
     # Server settings
-    host: str = Field(default="0.0.0.0", env="HOST")
-    port: int = Field(default=8000, env="PORT")
-    workers: int = Field(default=4, env="WORKERS")
-    
+    host: str = _env("HOST", "0.0.0.0")
+    port: int = _env("PORT", 8000, int)
+    workers: int = _env("WORKERS", 4, int)
+
     # Model settings
-    model_path: str = Field(default="/app/models", env="MODEL_PATH")
-    default_model: str = Field(default="default", env="DEFAULT_MODEL")
-    model_cache_size: int = Field(default=10, env="MODEL_CACHE_SIZE")
-    model_timeout: int = Field(default=300, env="MODEL_TIMEOUT")
-    
+    model_path: str = _env("MODEL_PATH", "/app/models")
+    default_model: str = _env("DEFAULT_MODEL", "default")
+    model_cache_size: int = _env("MODEL_CACHE_SIZE", 10, int)
+    model_timeout: int = _env("MODEL_TIMEOUT", 300, int)
+    prediction_cache_size: int = _env("PREDICTION_CACHE_SIZE", 10240, int)  # 0 disables
+    use_onnx: bool = _env("USE_ONNX", False, _to_bool)  # needs onnxruntime + skl2onnx
+    max_batch_size: int = _env("MAX_BATCH_SIZE", 1, int)  # 1 disables micro-batching
+    max_batch_delay_ms: float = _env("MAX_BATCH_DELAY_MS", 2.0, float)
+
     # Monitoring settings
-    enable_metrics: bool = Field(default=True, env="ENABLE_METRICS")
-    metrics_port: int = Field(default=9090, env="METRICS_PORT")
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
-    
+    enable_metrics: bool = _env("ENABLE_METRICS", True, _to_bool)
+    metrics_port: int = _env("METRICS_PORT", 9090, int)
+    log_level: str = _env("LOG_LEVEL", "INFO")
+    prediction_log_sample_rate: int = _env("PREDICTION_LOG_SAMPLE_RATE", 100, lambda v: max(1, int(v)))  # log 1 in N
+
     # Security settings
-    cors_origins: List[str] = Field(default=["*"], env="CORS_ORIGINS")
-    api_key: Optional[str] = Field(default=None, env="API_KEY")
-    
+    cors_origins: List[str] = _env("CORS_ORIGINS", ["*"], _to_list)
+    api_key: Optional[str] = _env("API_KEY")
+
     # Storage settings
-    storage_backend: str = Field(default="local", env="STORAGE_BACKEND")  # local, s3, azure
-    aws_bucket: Optional[str] = Field(default=None, env="AWS_BUCKET")
-    azure_container: Optional[str] = Field(default=None, env="AZURE_CONTAINER")
-    
+    storage_backend: str = _env("STORAGE_BACKEND", "local")  # local, s3, azure
+    aws_bucket: Optional[str] = _env("AWS_BUCKET")
+    azure_container: Optional[str] = _env("AZURE_CONTAINER")
+
     # Database settings (if needed)
-    database_url: Optional[str] = Field(default=None, env="DATABASE_URL")
-    redis_url: Optional[str] = Field(default=None, env="REDIS_URL")
-    
+    database_url: Optional[str] = _env("DATABASE_URL")
+    redis_url: Optional[str] = _env("REDIS_URL")
+
     # External services
-    mlflow_tracking_uri: Optional[str] = Field(default=None, env="MLFLOW_TRACKING_URI")
-    prometheus_gateway: Optional[str] = Field(default=None, env="PROMETHEUS_GATEWAY")
-    
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
-        case_sensitive = True
+    mlflow_tracking_uri: Optional[str] = _env("MLFLOW_TRACKING_URI")
+    prometheus_gateway: Optional[str] = _env("PROMETHEUS_GATEWAY")
 
 
 # Global settings instance
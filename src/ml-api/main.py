@@ -4,16 +4,27 @@ Provides REST API endpoints for model inference with monitoring and logging
 """
 
 import os
+import itertools
 import logging
 import time
 from typing import Dict, List, Any, Optional
 from contextlib import asynccontextmanager
 import asyncio
 
+# Parallelism comes from running one uvicorn worker process per core, so a
+# model call inside a process gains nothing from BLAS/OpenMP thread pools and
+# they only oversubscribe the CPU; pin them to one thread. Must be set before
+# numpy loads.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, "1")
+
+import msgspec
 import numpy as np
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
+import orjson
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
 import joblib
 from prometheus_client import Counter, Histogram, Gauge, generate_latest
@@ -21,8 +32,15 @@ from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST
 import structlog
 
 from models import ModelManager
+from cache import PredictionCache
+from batching import MicroBatcher
 from monitoring import setup_monitoring, metrics
-from config import Settings
+from config import settings
+
+
+def _orjson_log_dumps(event_dict: Dict[str, Any], **kwargs: Any) -> str:
+    """Serialize log events with orjson; structlog passes its fallback as default"""
+    return orjson.dumps(event_dict, default=kwargs.get("default")).decode()
 
 
 # Configure structured logging
@@ -32,7 +50,7 @@ structlog.configure(
         structlog.stdlib.add_logger_name,
         structlog.stdlib.add_log_level,
         structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.JSONRenderer()
+        structlog.processors.JSONRenderer(serializer=_orjson_log_dumps)
     ],
     context_class=dict,
     logger_factory=structlog.stdlib.LoggerFactory(),
@@ -40,12 +58,61 @@ structlog.configure(
     cache_logger_on_first_use=True,
 )
 
-logger = structlog.get_logger()
+logger = structlog.get_logger().bind(service="ml-api")
 
+# Only every Nth successful prediction is logged unless debug is on
+_prediction_log_counter = itertools.count()
 
-# Pydantic models for request/response
-class PredictionRequest(BaseModel):
+# Request ids are unique per worker process: pid prefix plus a counter
+_request_id_prefix = f"req_{os.getpid()}_"
+_next_request_number = itertools.count().__next__
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Fallback encoder for numpy values orjson cannot serialize natively"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson, with native numpy support"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        )
+
+
+# Request structs, decoded straight from the request body with msgspec
+class PredictionRequest(msgspec.Struct):
     """Request model for predictions"""
+    features: List[float]
+    model_name: Optional[str] = "default"
+    metadata: Optional[Dict[str, Any]] = {}
+
+
+_request_decoder = msgspec.json.Decoder(PredictionRequest)
+_batch_request_decoder = msgspec.json.Decoder(List[PredictionRequest])
+
+
+def _decode_body(decoder: msgspec.json.Decoder, body: bytes) -> Any:
+    """Decode and validate a JSON request body"""
+    try:
+        return decoder.decode(body)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+# Pydantic models for request/response
+class PredictionRequestSchema(BaseModel):
+    """OpenAPI schema for PredictionRequest"""
     features: List[float] = Field(..., description="Input features for prediction")
     model_name: Optional[str] = Field(default="default", description="Model name to use")
     metadata: Optional[Dict[str, Any]] = Field(default={}, description="Additional metadata")
@@ -72,19 +139,24 @@ class HealthResponse(BaseModel):
 
 # Global variables
 model_manager: ModelManager = None
-settings: Settings = None
+prediction_cache: PredictionCache = None
+batcher: Optional[MicroBatcher] = None
+process = None  # psutil.Process for this worker, created on first health check
 start_time: float = time.time()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global model_manager, settings
+    global model_manager, prediction_cache, batcher
     
     # Startup
     logger.info("Starting ML API service")
-    settings = Settings()
-    model_manager = ModelManager(settings.model_path)
+    model_manager = ModelManager(settings.model_path, use_onnx=settings.use_onnx)
+    prediction_cache = PredictionCache(settings.prediction_cache_size)
+    model_manager.start()
+    if settings.max_batch_size > 1:
+        batcher = MicroBatcher(settings.max_batch_size, settings.max_batch_delay_ms)
     
     # Load default models
     await model_manager.load_models()
@@ -95,6 +167,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("Shutting down ML API service")
+    if batcher is not None:
+        await batcher.close()
     await model_manager.cleanup()
 
 
@@ -105,6 +179,7 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -120,19 +195,17 @@ app.add_middleware(
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 
-# Dependency to get settings
-def get_settings() -> Settings:
-    return settings
-
-
 # Health check endpoints
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
-    import psutil
+    global process
+    if process is None:
+        import psutil
+        process = psutil.Process()
     
     uptime = time.time() - start_time
-    memory_usage = psutil.Process().memory_info().rss / 1024 / 1024  # MB
+    memory_usage = process.memory_info().rss / 1024 / 1024  # MB
     
     return HealthResponse(
         status="healthy",
@@ -154,12 +227,7 @@ async def readiness_check():
 @app.get("/metrics")
 async def get_metrics():
     """Prometheus metrics endpoint"""
-    from fastapi import Response
-    
-    return Response(
-        generate_latest(),
-        media_type=CONTENT_TYPE_LATEST
-    )
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
 # Model management endpoints
@@ -196,14 +264,13 @@ async def unload_model(model_name: str):
 
 
 # Prediction endpoints
-@app.post("/predict", response_model=PredictionResponse)
-async def predict(request: PredictionRequest, settings: Settings = Depends(get_settings)):
-    """Make predictions using the specified model"""
+async def _predict(request: PredictionRequest) -> Dict[str, Any]:
+    """Run a single prediction and return the response content"""
     if not model_manager:
         raise HTTPException(status_code=503, detail="Model manager not initialized")
     
-    start_time = time.time()
-    request_id = f"req_{int(start_time * 1000000)}"
+    start_time = time.monotonic()
+    request_id = f"{_request_id_prefix}{_next_request_number()}"
     
     try:
         # Record metrics
@@ -226,36 +293,66 @@ async def predict(request: PredictionRequest, settings: Settings = Depends(get_s
                 detail="Invalid input shape"
             )
         
-        # Make prediction
-        features = np.array(request.features).reshape(1, -1)
-        prediction = model_info["model"].predict(features)
-        
-        # Get probabilities if available
-        probabilities = None
-        if hasattr(model_info["model"], "predict_proba"):
-            probabilities = model_info["model"].predict_proba(features)[0].tolist()
+        # Make prediction, filling the model's preallocated input buffer.
+        # Batched rows wait in a queue, so they need their own array.
+        features = None
+        if batcher is None:
+            features = model_manager.get_buffer(request.model_name)
+        if features is None:
+            features = np.array(request.features, dtype=np.float32).reshape(1, -1)
+        else:
+            features[0, :] = request.features
+        # Hashing the features is skipped entirely when caching is disabled
+        cache_key = cached = None
+        if prediction_cache.max_size > 0:
+            cache_key = PredictionCache.make_key(request.model_name, model_info, features)
+            cached = prediction_cache.get(cache_key)
+            if cached is not None:
+                metrics.prediction_cache_hits_total.labels(model_name=request.model_name).inc()
+            else:
+                metrics.prediction_cache_misses_total.labels(model_name=request.model_name).inc()
+        if cached is not None:
+            prediction, probabilities = cached
+        else:
+            if batcher is not None:
+                prediction, probabilities = await batcher.submit(
+                    request.model_name, model_info, features[0]
+                )
+            else:
+                prediction, probabilities = model_info["predict_with_proba"](features)
+                if probabilities is not None:
+                    probabilities = probabilities[0]
+            
+            if cache_key is not None:
+                prediction_cache.put(cache_key, prediction, probabilities)
         
-        processing_time = (time.time() - start_time) * 1000
+        processing_time = (time.monotonic() - start_time) * 1000
         
         # Record metrics
         metrics.prediction_duration_seconds.observe(processing_time / 1000)
         metrics.predictions_total.labels(model_name=request.model_name).inc()
         
-        logger.info(
-            "Prediction completed",
-            request_id=request_id,
-            model_name=request.model_name,
-            processing_time_ms=processing_time
-        )
+        if settings.debug or next(_prediction_log_counter) % settings.prediction_log_sample_rate == 0:
+            logger.info(
+                "Prediction completed",
+                request_id=request_id,
+                model_name=request.model_name,
+                processing_time_ms=processing_time
+            )
         
-        return PredictionResponse(
-            prediction=prediction.tolist(),
-            probability=probabilities,
-            model_name=request.model_name,
-            model_version=model_info.get("version", "unknown"),
-            processing_time_ms=processing_time,
-            request_id=request_id
-        )
+        # Only the inbound PredictionRequest is validated. Every field below
+        # comes from our own computation, so building (or constructing) a
+        # PredictionResponse here would only re-check trusted data; numpy
+        # outputs are encoded directly by orjson and PredictionResponse just
+        # documents the schema
+        return {
+            "prediction": prediction.astype(np.float64, copy=False),
+            "probability": probabilities,
+            "model_name": request.model_name,
+            "model_version": model_info.get("version", "unknown"),
+            "processing_time_ms": processing_time,
+            "request_id": request_id
+        }
         
     except Exception as e:
         metrics.prediction_errors_total.labels(error_type="prediction_error").inc()
@@ -268,21 +365,125 @@ async def predict(request: PredictionRequest, settings: Settings = Depends(get_s
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
 
-@app.post("/predict/batch")
-async def predict_batch(requests: List[PredictionRequest]):
+@app.post(
+    "/predict",
+    responses={200: {"model": PredictionResponse}},
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": PredictionRequestSchema.model_json_schema()}}
+    }}
+)
+async def predict(raw_request: Request):
+    """Make predictions using the specified model"""
+    request = _decode_body(_request_decoder, await raw_request.body())
+    return ORJSONResponse(await _predict(request))
+
+
+@app.post(
+    "/predict/batch",
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {
+            "type": "array",
+            "items": PredictionRequestSchema.model_json_schema()
+        }}}
+    }}
+)
+async def predict_batch(raw_request: Request):
     """Make batch predictions"""
     if not model_manager:
         raise HTTPException(status_code=503, detail="Model manager not initialized")
     
-    results = []
-    for request in requests:
-        try:
-            result = await predict(request)
-            results.append(result)
-        except HTTPException as e:
-            results.append({"error": e.detail, "status_code": e.status_code})
+    requests = _decode_body(_batch_request_decoder, await raw_request.body())
+    
+    # Group requests by model so each model runs once over a stacked matrix
+    groups: Dict[str, List[int]] = {}
+    for i, request in enumerate(requests):
+        groups.setdefault(request.model_name, []).append(i)
     
-    return {"results": results}
+    results: List[Any] = [None] * len(requests)
+    for model_name, indices in groups.items():
+        model_info = model_manager.get_model(model_name)
+        batched = []
+        if model_info:
+            batched = [
+                i for i in indices
+                if len(requests[i].features) == model_info.get("input_shape", len(requests[i].features))
+            ]
+            if batched:
+                try:
+                    rows = _predict_rows(model_name, model_info, [requests[i] for i in batched])
+                    for i, row in zip(batched, rows):
+                        results[i] = row
+                except Exception as e:
+                    logger.error(
+                        "Batch prediction failed, falling back to single predictions",
+                        error=str(e),
+                        model_name=model_name
+                    )
+                    batched = []
+        
+        # Unknown models, mismatched shapes and failed batches take the
+        # single-request path so they report the same per-request errors
+        for i in indices:
+            if results[i] is not None:
+                continue
+            try:
+                results[i] = await _predict(requests[i])
+            except HTTPException as e:
+                results[i] = {"error": e.detail, "status_code": e.status_code}
+    
+    return ORJSONResponse({"results": results})
+
+
+def _predict_rows(
+    model_name: str,
+    model_info: Dict[str, Any],
+    requests: List[PredictionRequest]
+) -> List[Dict[str, Any]]:
+    """Run one model call over a group of shape-validated requests"""
+    start_time = time.monotonic()
+    
+    # Rows are already shape-validated, so the matrix can be filled from one
+    # flat iterator without numpy's nested-list type discovery
+    n_features = len(requests[0].features)
+    features = np.fromiter(
+        itertools.chain.from_iterable(request.features for request in requests),
+        dtype=np.float32,
+        count=len(requests) * n_features
+    ).reshape(len(requests), n_features)
+    prediction, probabilities = model_info["predict_with_proba"](features)
+    prediction = prediction.astype(np.float64, copy=False)
+    
+    processing_time = (time.monotonic() - start_time) * 1000
+    
+    metrics.prediction_requests_total.inc(len(requests))
+    # One sample per row, as when each request was predicted on its own, so
+    # the histogram's count and mean stay per request
+    row_seconds = processing_time / 1000 / len(requests)
+    for _ in requests:
+        metrics.prediction_duration_seconds.observe(row_seconds)
+    metrics.predictions_total.labels(model_name=model_name).inc(len(requests))
+    
+    logger.info(
+        "Batch prediction completed",
+        model_name=model_name,
+        batch_size=len(requests),
+        processing_time_ms=processing_time
+    )
+    
+    model_version = model_info.get("version", "unknown")
+    return [
+        {
+            "prediction": prediction[i:i + 1],
+            "probability": probabilities[i] if probabilities is not None else None,
+            "model_name": model_name,
+            "model_version": model_version,
+            "processing_time_ms": processing_time,
+            "request_id": f"{_request_id_prefix}{_next_request_number()}"
+        }
+        for i in range(len(requests))
+    ]
 
 
 # Model information endpoints
@@ -300,6 +501,7 @@ async def get_model_info(model_name: str):
         "name": model_name,
         "version": model_info.get("version", "unknown"),
         "type": model_info.get("type", "unknown"),
+        "backend": model_info.get("backend", "sklearn"),
         "input_shape": model_info.get("input_shape"),
         "output_shape": model_info.get("output_shape"),
         "loaded_at": model_info.get("loaded_at"),
@@ -309,4 +511,13 @@ async def get_model_info(model_name: str):
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    uvicorn.run(
+        "main:app",
+        host=settings.host,
+        port=settings.port,
+        workers=settings.workers,
+        loop="uvloop",
+        http="httptools",
+        log_level=settings.log_level.lower()
+    )
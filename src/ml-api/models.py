@@ -6,8 +6,10 @@ Handles loading, caching, and lifecycle management of ML models
 import os
 import json
 import asyncio
+import threading
 import time
-from typing import Dict, List, Optional, Any
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, List, Optional, Any, Tuple
 from pathlib import Path
 import joblib
 import numpy as np
@@ -16,14 +18,112 @@ import structlog
 logger = structlog.get_logger()
 
 
+Predictor = Callable[[np.ndarray], Tuple[np.ndarray, Optional[np.ndarray]]]
+
+
+def build_sklearn_predictor(model: Any) -> Predictor:
+    """Wrap a scikit-learn model as X -> (predictions, probabilities or None)"""
+    # Bound methods are resolved once here so the prediction path doesn't
+    # repeat the attribute lookups per request
+    predict = model.predict
+    predict_proba = getattr(model, "predict_proba", None)
+    
+    if predict_proba is None:
+        def predict_with_proba(X: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+            return predict(X), None
+    else:
+        def predict_with_proba(X: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+            return predict(X), predict_proba(X)
+    return predict_with_proba
+
+
+def build_onnx_predictor(model: Any, n_features: int) -> Optional[Predictor]:
+    """Convert a scikit-learn model to ONNX and return X -> (predictions, probabilities or None)
+    
+    Labels and probabilities come from a single run of the graph. Returns None when onnxruntime/skl2onnx are not installed or the model
+    cannot be converted, in which case the scikit-learn model is served.
+    """
+    try:
+        import onnxruntime as ort
+        from skl2onnx import convert_sklearn
+        from skl2onnx.common.data_types import FloatTensorType
+    except ImportError:
+        logger.warning("onnxruntime or skl2onnx not installed, serving scikit-learn model")
+        return None
+    
+    is_classifier = hasattr(model, "predict_proba")
+    try:
+        onnx_model = convert_sklearn(
+            model,
+            initial_types=[("input", FloatTensorType([None, n_features]))],
+            # Plain probability tensors instead of a list of dicts per row
+            options={id(model): {"zipmap": False}} if is_classifier else None
+        )
+    except Exception as e:
+        logger.warning(f"ONNX conversion failed, serving scikit-learn model: {e}")
+        return None
+    
+    # One thread per session: uvicorn workers already use one process per
+    # core, so more intra-op threads would only oversubscribe the CPU
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = 1
+    session = ort.InferenceSession(
+        onnx_model.SerializeToString(),
+        sess_options,
+        providers=["CPUExecutionProvider"]
+    )
+    output_names = [output.name for output in session.get_outputs()]
+    
+    requested = output_names[:2] if is_classifier else output_names[:1]
+    
+    def predict_with_proba(X: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        outputs = session.run(requested, {"input": X.astype(np.float32, copy=False)})
+        # Regressors come back as (N, 1); sklearn's predict returns (N,)
+        return outputs[0].ravel(), outputs[1] if is_classifier else None
+    
+    return predict_with_proba
+
+
 class ModelManager:
     """Manages ML models loading, caching, and lifecycle"""
     
-    def __init__(self, model_path: str, cache_size: int = 10):
+    def __init__(self, model_path: str, cache_size: int = 10, use_onnx: bool = False):
         self.model_path = Path(model_path)
         self.cache_size = cache_size
+        self.use_onnx = use_onnx
+        # Replaced wholesale on load/unload so readers never see a dict
+        # that is being mutated
         self.loaded_models: Dict[str, Dict[str, Any]] = {}
         self._lock = asyncio.Lock()
+        self._buffers = threading.local()
+        
+        # Access stats are kept off the read path: get_model only appends to
+        # the access log, which is folded into _stats in the background.
+        # _stats is ordered least to most recently used, for LRU eviction.
+        self._stats: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self._access_log: Deque[Tuple[str, float]] = deque(maxlen=100000)
+        self._stats_task: Optional[asyncio.Task] = None
+    
+    def start(self, interval: float = 1.0):
+        """Start the background task that aggregates model access stats"""
+        if self._stats_task is None:
+            self._stats_task = asyncio.create_task(self._stats_loop(interval))
+    
+    async def _stats_loop(self, interval: float):
+        """Periodically fold the access log into the stats table"""
+        while True:
+            await asyncio.sleep(interval)
+            self._drain_access_log()
+    
+    def _drain_access_log(self):
+        """Apply pending accesses to the stats table"""
+        while self._access_log:
+            model_name, accessed_at = self._access_log.popleft()
+            entry = self._stats.get(model_name)
+            if entry is not None:
+                entry[0] += 1
+                entry[1] = accessed_at
+                self._stats.move_to_end(model_name)
         
     async def load_models(self):
         """Load all available models from the model directory"""
@@ -31,14 +131,25 @@ class ModelManager:
             logger.warning(f"Model path {self.model_path} does not exist")
             return
             
-        for model_file in self.model_path.glob("*.pkl"):
+        for model_file in self._model_files():
             model_name = model_file.stem
             try:
-                await self.load_model(model_name)
-                logger.info(f"Loaded model: {model_name}")
+                if await self.load_model(model_name):
+                    logger.info(f"Loaded model: {model_name}")
             except Exception as e:
                 logger.error(f"Failed to load model {model_name}: {e}")
     
+    def _model_files(self) -> List[Path]:
+        """Model pickles in the model directory
+        
+        The training pipeline saves each model's scaler next to it as
+        <name>_scaler.pkl; those are preprocessing artifacts, not models.
+        """
+        return [
+            model_file for model_file in self.model_path.glob("*.pkl")
+            if not model_file.stem.endswith("_scaler")
+        ]
+    
     async def load_model(self, model_name: str) -> bool:
         """Load a specific model"""
         async with self._lock:
@@ -54,8 +165,10 @@ class ModelManager:
                 return False
                 
             try:
-                # Load model
-                model = joblib.load(model_file)
+                # Load model off the event loop. numpy arrays are memory-mapped
+                # so workers share page-cache pages instead of private copies;
+                # this only applies to uncompressed joblib.dump files
+                model = await asyncio.to_thread(joblib.load, model_file, mmap_mode='r')
                 
                 # Load metadata
                 metadata = {}
@@ -63,18 +176,40 @@ class ModelManager:
                     with open(metadata_file, 'r') as f:
                         metadata = json.load(f)
                 
+                if not hasattr(model, "predict"):
+                    logger.warning(f"Skipping {model_file}: object has no predict method")
+                    return False
+                
+                predictor = None
+                backend = "sklearn"
+                n_features = metadata.get("input_shape") or getattr(model, "n_features_in_", None)
+                if self.use_onnx and n_features:
+                    predictor = await asyncio.to_thread(build_onnx_predictor, model, n_features)
+                    if predictor is not None:
+                        backend = "onnxruntime"
+                if predictor is None:
+                    predictor = build_sklearn_predictor(model)
+                
                 # Store model info
-                self.loaded_models[model_name] = {
+                models = dict(self.loaded_models)
+                models[model_name] = {
                     "model": model,
+                    "predict_with_proba": predictor,
+                    "backend": backend,
                     "loaded_at": time.time(),
                     "metadata": metadata,
                     "version": metadata.get("version", "unknown"),
                     "type": metadata.get("type", "unknown"),
                     "input_shape": metadata.get("input_shape"),
-                    "output_shape": metadata.get("output_shape"),
-                    "access_count": 0,
-                    "last_accessed": time.time()
+                    "output_shape": metadata.get("output_shape")
                 }
+                # Apply pending accesses first: draining reorders _stats, and
+                # doing it after the insert would put older models behind
+                # the new one and make it the first to be evicted
+                self._drain_access_log()
+                self._stats[model_name] = [0, time.time()]
+                self._stats.move_to_end(model_name)
+                self.loaded_models = models
                 
                 # Manage cache size
                 await self._manage_cache()
@@ -90,29 +225,47 @@ class ModelManager:
         """Unload a specific model"""
         async with self._lock:
             if model_name in self.loaded_models:
-                del self.loaded_models[model_name]
+                models = dict(self.loaded_models)
+                del models[model_name]
+                self.loaded_models = models
+                self._stats.pop(model_name, None)
                 logger.info(f"Unloaded model: {model_name}")
                 return True
             return False
     
     def get_model(self, model_name: str) -> Optional[Dict[str, Any]]:
         """Get a loaded model"""
-        if model_name in self.loaded_models:
-            model_info = self.loaded_models[model_name]
-            model_info["access_count"] += 1
-            model_info["last_accessed"] = time.time()
-            return model_info
-        return None
+        model_info = self.loaded_models.get(model_name)
+        if model_info is not None:
+            self._access_log.append((model_name, time.time()))
+        return model_info
+    
+    def get_buffer(self, model_name: str) -> Optional[np.ndarray]:
+        """Get a reusable (1, input_shape) float32 input buffer for a model
+        
+        Buffers are kept per thread, so callers must fill and consume them
+        without yielding to other work in between.
+        """
+        model_info = self.loaded_models.get(model_name)
+        if not model_info or not model_info.get("input_shape"):
+            return None
+        
+        buffers = getattr(self._buffers, "by_model", None)
+        if buffers is None:
+            buffers = self._buffers.by_model = {}
+        
+        buffer = buffers.get(model_name)
+        if buffer is None or buffer.shape[1] != model_info["input_shape"]:
+            buffer = np.empty((1, model_info["input_shape"]), dtype=np.float32)
+            buffers[model_name] = buffer
+        return buffer
     
     async def list_available_models(self) -> List[str]:
         """List all available models in the model directory"""
         if not self.model_path.exists():
             return []
             
-        models = []
-        for model_file in self.model_path.glob("*.pkl"):
-            models.append(model_file.stem)
-        return models
+        return [model_file.stem for model_file in self._model_files()]
     
     def is_ready(self) -> bool:
         """Check if the model manager is ready"""
@@ -122,28 +275,33 @@ class ModelManager:
         """Manage model cache size by removing least recently used models"""
         if len(self.loaded_models) <= self.cache_size:
             return
-            
-        # Sort models by last accessed time
-        sorted_models = sorted(
-            self.loaded_models.items(),
-            key=lambda x: x[1]["last_accessed"]
-        )
         
-        # Remove oldest models
-        models_to_remove = len(self.loaded_models) - self.cache_size
-        for i in range(models_to_remove):
-            model_name = sorted_models[i][0]
-            del self.loaded_models[model_name]
+        self._drain_access_log()
+        
+        # Remove least recently used models
+        models = dict(self.loaded_models)
+        while len(models) > self.cache_size and self._stats:
+            model_name, _ = self._stats.popitem(last=False)
+            models.pop(model_name, None)
             logger.info(f"Removed model from cache: {model_name}")
+        self.loaded_models = models
     
     async def cleanup(self):
         """Cleanup resources"""
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+        
         async with self._lock:
-            self.loaded_models.clear()
+            self.loaded_models = {}
+            self._stats.clear()
+            self._access_log.clear()
             logger.info("Model manager cleaned up")
     
     def get_model_stats(self) -> Dict[str, Any]:
         """Get statistics about loaded models"""
+        self._drain_access_log()
+        
         stats = {
             "total_loaded": len(self.loaded_models),
             "cache_size": self.cache_size,
@@ -155,8 +313,8 @@ class ModelManager:
                 "version": info["version"],
                 "type": info["type"],
                 "loaded_at": info["loaded_at"],
-                "access_count": info["access_count"],
-                "last_accessed": info["last_accessed"]
+                "access_count": self._stats[name][0],
+                "last_accessed": self._stats[name][1]
             }
             
         return stats
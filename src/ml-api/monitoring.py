@@ -37,6 +37,18 @@ class MetricsCollector:
             ['model_name']
         )
         
+        self.prediction_cache_hits_total = Counter(
+            'ml_api_prediction_cache_hits_total',
+            'Total number of predictions served from the prediction cache',
+            ['model_name']
+        )
+        
+        self.prediction_cache_misses_total = Counter(
+            'ml_api_prediction_cache_misses_total',
+            'Total number of predictions that missed the prediction cache',
+            ['model_name']
+        )
+        
         # Model metrics
         self.models_loaded_total = Gauge(
             'ml_api_models_loaded_total',
@@ -2,9 +2,23 @@
 Test configuration
 """
 
-import pytest
+import os
+import sys
 from pathlib import Path
 
+# The services are run as scripts from their own directories, so their
+# modules import each other by bare name; mirror that for the tests
+SRC_DIR = Path(__file__).resolve().parent.parent
+for _service in ("ml-api", "training"):
+    sys.path.insert(0, str(SRC_DIR / _service))
+
+# Run Numba kernels as plain Python under test: JIT compiles are slow, defeat
+# coverage, and are exercised separately by the "jit" CI job
+os.environ.setdefault("NUMBA_DISABLE_JIT", "1")
+
+import numpy as np
+import pytest
+
 
 @pytest.fixture
 def test_data_path():
@@ -12,6 +26,12 @@ def test_data_path():
     return Path(__file__).parent / "data"
 
 
+@pytest.fixture
+def rng():
+    """Freshly seeded random generator, so each test sees the same stream"""
+    return np.random.default_rng(42)
+
+
 @pytest.fixture
 def sample_features():
     """Sample features for testing"""
@@ -2,9 +2,20 @@
 Tests for ML API - Simplified for CI/CD
 """
 
+import asyncio
+import threading
 import pytest
 import numpy as np
 import json
+import joblib
+from sklearn.linear_model import LinearRegression, LogisticRegression
+from sklearn.preprocessing import StandardScaler
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from models import ModelManager, build_onnx_predictor
+from cache import PredictionCache
+from batching import MicroBatcher
 
 
 def test_data_validation():
@@ -20,64 +31,6 @@ def test_data_validation():
     assert np_array.dtype == np.float64
 
 
-def test_model_configuration():
-    """Test model configuration structure"""
-    config = {
-        "model_name": "test_model",
-        "version": "1.0.0",
-        "features": ["feature_1", "feature_2", "feature_3"],
-        "target": "target_value"
-    }
-    
-    assert "model_name" in config
-    assert "version" in config
-    assert isinstance(config["features"], list)
-    assert len(config["features"]) > 0
-
-
-def test_prediction_request_format():
-    """Test prediction request format validation"""
-    request_data = {
-        "features": [1.0, 2.0, 3.0, 4.0, 5.0],
-        "model_name": "default",
-        "metadata": {"test": True}
-    }
-    
-    # Validate request structure
-    assert "features" in request_data
-    assert "model_name" in request_data
-    assert isinstance(request_data["features"], list)
-    assert isinstance(request_data["model_name"], str)
-    
-    # Test serialization
-    json_str = json.dumps(request_data)
-    parsed_data = json.loads(json_str)
-    assert parsed_data == request_data
-
-
-def test_response_format():
-    """Test prediction response format"""
-    response_data = {
-        "prediction": 0.75,
-        "confidence": 0.95,
-        "model_name": "default",
-        "version": "1.0.0",
-        "timestamp": "2024-01-01T00:00:00Z"
-    }
-    
-    # Validate response structure
-    assert "prediction" in response_data
-    assert "confidence" in response_data
-    assert "model_name" in response_data
-    assert "version" in response_data
-    assert "timestamp" in response_data
-    
-    # Validate data types
-    assert isinstance(response_data["prediction"], (int, float))
-    assert isinstance(response_data["confidence"], (int, float))
-    assert 0 <= response_data["confidence"] <= 1
-
-
 def test_error_handling():
     """Test error handling scenarios"""
     # Test invalid feature types
@@ -98,37 +51,259 @@ def test_error_handling():
         assert True
 
 
-def test_metrics_collection():
-    """Test metrics collection logic"""
-    metrics = {
-        "total_requests": 100,
-        "successful_predictions": 95,
-        "failed_predictions": 5,
-        "average_response_time": 0.25
+@pytest.fixture
+def model_dir(tmp_path, rng):
+    """Model directory laid out as the training pipeline writes it"""
+    X = rng.standard_normal((40, 3)).astype(np.float32)
+    y = X.sum(axis=1)
+    models = {
+        "reg": LinearRegression().fit(X, y),
+        "clf": LogisticRegression().fit(X, (y > 0).astype(int)),
     }
+    for name, model in models.items():
+        joblib.dump(model, tmp_path / f"{name}.pkl")
+        (tmp_path / f"{name}_metadata.json").write_text(json.dumps({"version": "1.0.0", "input_shape": 3}))
+    return tmp_path
+
+
+def test_model_manager_skips_scalers(model_dir, rng):
+    """Test scaler artifacts saved next to models are not loaded as models"""
+    joblib.dump(StandardScaler().fit(rng.standard_normal((10, 3))), model_dir / "reg_scaler.pkl")
     
-    # Calculate success rate
-    success_rate = metrics["successful_predictions"] / metrics["total_requests"]
-    assert 0 <= success_rate <= 1
-    assert success_rate == 0.95
+    async def load():
+        manager = ModelManager(str(model_dir))
+        await manager.load_models()
+        return manager, await manager.list_available_models(), await manager.load_model("reg_scaler")
     
-    # Validate metrics structure
-    assert all(isinstance(v, (int, float)) for v in metrics.values())
+    manager, available, scaler_loaded = asyncio.run(load())
+    assert sorted(manager.loaded_models) == ["clf", "reg"]
+    assert sorted(available) == ["clf", "reg"]
+    assert scaler_loaded is False
 
 
-def test_model_versioning():
-    """Test model versioning logic"""
-    version_info = {
-        "major": 1,
-        "minor": 2,
-        "patch": 3,
-        "build": "20240101"
-    }
+@pytest.mark.parametrize("model_cls", [LinearRegression, LogisticRegression])
+def test_onnx_predictor_matches_sklearn(model_cls, rng, monkeypatch):
+    """Test ONNX outputs match scikit-learn's and come from one graph run"""
+    ort = pytest.importorskip("onnxruntime")
+    pytest.importorskip("skl2onnx")
+    
+    X = rng.standard_normal((20, 3)).astype(np.float32)
+    y = X.sum(axis=1)
+    model = model_cls().fit(X, (y > 0).astype(int) if model_cls is LogisticRegression else y)
+    predict_with_proba = build_onnx_predictor(model, 3)
+    
+    runs = []
+    session_run = ort.InferenceSession.run
+    
+    def counting_run(self, *args, **kwargs):
+        runs.append(args[0])
+        return session_run(self, *args, **kwargs)
+    
+    monkeypatch.setattr(ort.InferenceSession, "run", counting_run)
+    prediction, probabilities = predict_with_proba(X[:2])
+    
+    assert len(runs) == 1
+    expected = model.predict(X[:2])
+    assert prediction.shape == expected.shape
+    assert np.allclose(prediction, expected, atol=1e-5)
+    if model_cls is LogisticRegression:
+        assert np.allclose(probabilities, model.predict_proba(X[:2]), atol=1e-5)
+    else:
+        assert probabilities is None
+
+
+def test_model_manager_evicts_least_recently_used(model_dir):
+    """Test loading past cache_size evicts the least recently used model"""
+    async def load():
+        manager = ModelManager(str(model_dir), cache_size=1)
+        assert await manager.load_model("reg")
+        assert manager.get_model("reg") is not None
+        assert await manager.load_model("clf")
+        return manager
+    
+    manager = asyncio.run(load())
+    assert list(manager.loaded_models) == ["clf"]
+
+
+def test_micro_batcher_close_fails_waiting_callers():
+    """Test closing the batcher answers callers instead of leaving them hanging"""
+    model_info = {"predict_with_proba": lambda X: (X.sum(axis=1), None)}
+    
+    async def run():
+        # A long delay keeps the rows waiting in the worker's gather loop
+        batcher = MicroBatcher(max_batch_size=8, max_delay_ms=10000)
+        pending = [
+            asyncio.ensure_future(batcher.submit("model", model_info, np.zeros(3, dtype=np.float32)))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.01)
+        await batcher.close()
+        results = await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), 1)
+        
+        with pytest.raises(RuntimeError):
+            await batcher.submit("model", model_info, np.zeros(3, dtype=np.float32))
+        return results
+    
+    results = asyncio.run(run())
+    assert len(results) == 3
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_micro_batcher_retires_idle_workers():
+    """Test a model's worker exits once idle and restarts on the next submit"""
+    model_info = {"predict_with_proba": lambda X: (X.sum(axis=1), None)}
+    row = np.ones(3, dtype=np.float32)
+    
+    async def run():
+        batcher = MicroBatcher(max_batch_size=8, max_delay_ms=1, idle_timeout=0.05)
+        try:
+            await batcher.submit("evicted", model_info, row)
+            assert list(batcher._tasks) == ["evicted"]
+            await asyncio.sleep(0.2)
+            assert not batcher._tasks and not batcher._queues
+            
+            prediction, _ = await batcher.submit("evicted", model_info, row)
+            assert prediction.tolist() == [3.0]
+        finally:
+            await batcher.close()
+    
+    asyncio.run(run())
+
+
+def test_metrics_endpoint():
+    """Test /metrics returns the exposition as one sized body"""
+    import main
+    
+    # Uncompressed, so Content-Length describes the exposition itself
+    response = TestClient(main.app).get("/metrics", headers={"Accept-Encoding": "identity"})
+    
+    assert response.status_code == 200
+    assert int(response.headers["content-length"]) == len(response.content)
+    assert b"ml_api_prediction_requests_total" in response.content
+
+
+def test_predict_batch(model_dir, monkeypatch):
+    """Test batch predictions come back in request order with per-row errors"""
+    import main
+    
+    manager = ModelManager(str(model_dir))
+    asyncio.run(manager.load_models())
+    monkeypatch.setattr(main, "model_manager", manager)
+    monkeypatch.setattr(main, "prediction_cache", PredictionCache(0))
+    
+    def fail_make_key(*args):
+        raise AssertionError("features hashed with the cache disabled")
+    
+    monkeypatch.setattr(PredictionCache, "make_key", staticmethod(fail_make_key))
+    client = TestClient(main.app)
+    
+    requests = [
+        {"features": [0.1, 0.2, 0.3], "model_name": "reg"},
+        {"features": [1.0, -1.0, 2.0], "model_name": "clf"},
+        {"features": [1.0, 2.0], "model_name": "reg"},
+        {"features": [1.0, 2.0, 3.0], "model_name": "missing"},
+        {"features": [-0.5, 0.5, 1.5], "model_name": "reg"},
+        {"features": [0.0, 0.0, -1.0], "model_name": "clf"},
+    ]
+    observations_before = REGISTRY.get_sample_value("ml_api_prediction_duration_seconds_count") or 0.0
+    response = client.post("/predict/batch", json=requests)
+    assert response.status_code == 200
+    # One duration sample per successful row, as for single predictions
+    assert REGISTRY.get_sample_value("ml_api_prediction_duration_seconds_count") - observations_before == 4
+    results = response.json()["results"]
+    assert len(results) == len(requests)
+    
+    # Successful rows match what the single-request endpoint returns
+    for i in (0, 1, 4, 5):
+        single = client.post("/predict", json=requests[i]).json()
+        assert results[i]["model_name"] == requests[i]["model_name"]
+        assert np.allclose(results[i]["prediction"], single["prediction"])
+        if requests[i]["model_name"] == "clf":
+            assert np.allclose(results[i]["probability"], single["probability"])
+        else:
+            assert results[i]["probability"] is None
+    
+    # Per-row errors are the ones /predict raises, which wraps them in a 500
+    assert results[2] == {"error": "Prediction failed: 400: Invalid input shape", "status_code": 500}
+    assert results[3] == {"error": "Prediction failed: 404: Model missing not found", "status_code": 500}
+
+
+def test_prediction_cache():
+    """Test prediction cache LRU order, eviction and keying"""
+    model_info = {"version": "1.0.0", "loaded_at": 1.0}
+    keys = [
+        PredictionCache.make_key("model", model_info, np.array([[float(i)]]))
+        for i in range(3)
+    ]
+    
+    cache = PredictionCache(max_size=2)
+    cache.put(keys[0], np.array([0.0]), None)
+    cache.put(keys[1], np.array([1.0]), None)
+    
+    # A hit makes keys[0] most recently used, so keys[1] is evicted next
+    assert cache.get(keys[0])[0][0] == 0.0
+    cache.put(keys[2], np.array([2.0]), None)
+    assert len(cache) == 2
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    
+    # max_size=0 disables caching
+    disabled = PredictionCache(max_size=0)
+    disabled.put(keys[0], np.array([0.0]), None)
+    assert len(disabled) == 0
+    assert disabled.get(keys[0]) is None
+    
+    # Stored outputs don't keep the batch arrays they were sliced from alive
+    batch_prediction = np.arange(4.0)
+    batch_probabilities = np.ones((4, 2))
+    cache.put(keys[0], batch_prediction[1:2], batch_probabilities[1])
+    prediction, probabilities = cache.get(keys[0])
+    assert not np.shares_memory(prediction, batch_prediction)
+    assert not np.shares_memory(probabilities, batch_probabilities)
+    
+    # Reloading a model changes loaded_at, so its old outputs are unreachable
+    features = np.array([[1.0, 2.0]])
+    reloaded = dict(model_info, loaded_at=2.0)
+    assert PredictionCache.make_key("model", model_info, features) == PredictionCache.make_key("model", model_info, features)
+    assert PredictionCache.make_key("model", model_info, features) != PredictionCache.make_key("model", reloaded, features)
+
+
+def test_micro_batcher():
+    """Test concurrent submits share one model call and each get their own row"""
+    calls = []
+    
+    def predict_with_proba(X):
+        calls.append((X.shape, threading.get_ident()))
+        return X.sum(axis=1), np.column_stack([X[:, 0], -X[:, 0]])
+    
+    def failing_predict(X):
+        raise RuntimeError("model exploded")
+    
+    model_info = {"predict_with_proba": predict_with_proba}
+    failing_info = {"predict_with_proba": failing_predict}
+    rows = [np.full(3, i, dtype=np.float32) for i in range(5)]
+    
+    async def run():
+        batcher = MicroBatcher(max_batch_size=8, max_delay_ms=50)
+        try:
+            results = await asyncio.gather(*(batcher.submit("model", model_info, row) for row in rows))
+            errors = await asyncio.gather(
+                *(batcher.submit("failing", failing_info, row) for row in rows[:3]),
+                return_exceptions=True
+            )
+        finally:
+            await batcher.close()
+        return results, errors
+    
+    results, errors = asyncio.run(run())
     
-    version_string = f"{version_info['major']}.{version_info['minor']}.{version_info['patch']}"
-    assert version_string == "1.2.3"
+    # One call for all five rows, made off the event loop's thread
+    assert [shape for shape, _ in calls] == [(5, 3)]
+    assert calls[0][1] != threading.get_ident()
+    for i, (prediction, probabilities) in enumerate(results):
+        assert prediction.tolist() == [3.0 * i]
+        assert probabilities.tolist() == [i, -i]
     
-    # Test version comparison
-    assert version_info["major"] >= 1
-    assert version_info["minor"] >= 0
-    assert version_info["patch"] >= 0
+    assert len(errors) == 3
+    assert all(isinstance(e, RuntimeError) and str(e) == "model exploded" for e in errors)
@@ -0,0 +1,131 @@
+"""
+Tests for configuration and payload shapes shared by the ML API and training pipeline
+"""
+
+import json
+
+import pytest
+
+
+SCHEMA_CASES = [
+    # ML API payloads
+    pytest.param(
+        {
+            "model_name": "test_model",
+            "version": "1.0.0",
+            "features": ["feature_1", "feature_2", "feature_3"],
+            "target": "target_value"
+        },
+        {"model_name": str, "version": str, "features": list},
+        lambda config: len(config["features"]) > 0,
+        id="model_configuration",
+    ),
+    pytest.param(
+        {
+            "features": [1.0, 2.0, 3.0, 4.0, 5.0],
+            "model_name": "default",
+            "metadata": {"test": True}
+        },
+        {"features": list, "model_name": str},
+        # Survives a JSON round trip unchanged
+        lambda request: json.loads(json.dumps(request)) == request,
+        id="prediction_request",
+    ),
+    pytest.param(
+        {
+            "prediction": 0.75,
+            "confidence": 0.95,
+            "model_name": "default",
+            "version": "1.0.0",
+            "timestamp": "2024-01-01T00:00:00Z"
+        },
+        {"prediction": (int, float), "confidence": (int, float), "model_name": str, "version": str, "timestamp": str},
+        lambda response: 0 <= response["confidence"] <= 1,
+        id="prediction_response",
+    ),
+    pytest.param(
+        {
+            "total_requests": 100,
+            "successful_predictions": 95,
+            "failed_predictions": 5,
+            "average_response_time": 0.25
+        },
+        {
+            "total_requests": int,
+            "successful_predictions": int,
+            "failed_predictions": int,
+            "average_response_time": (int, float)
+        },
+        lambda metrics: metrics["successful_predictions"] / metrics["total_requests"] == 0.95,
+        id="metrics_collection",
+    ),
+    pytest.param(
+        {
+            "major": 1,
+            "minor": 2,
+            "patch": 3,
+            "build": "20240101"
+        },
+        {"major": int, "minor": int, "patch": int, "build": str},
+        lambda version: (
+            f"{version['major']}.{version['minor']}.{version['patch']}" == "1.2.3"
+            and version["major"] >= 1 and version["minor"] >= 0 and version["patch"] >= 0
+        ),
+        id="model_versioning",
+    ),
+    # Training configuration
+    pytest.param(
+        {
+            'learning_rate': 0.01,
+            'max_depth': 6,
+            'n_estimators': 100,
+            'random_state': 42
+        },
+        {'learning_rate': float, 'max_depth': int, 'n_estimators': int, 'random_state': int},
+        lambda params: (
+            0 < params['learning_rate'] <= 1
+            and params['max_depth'] > 0 and params['n_estimators'] > 0
+        ),
+        id="hyperparameters",
+    ),
+    pytest.param(
+        {
+            'cv_folds': 5,
+            'scoring': 'neg_mean_squared_error',
+            'shuffle': True,
+            'random_state': 42
+        },
+        {'cv_folds': int, 'scoring': str, 'shuffle': bool, 'random_state': int},
+        lambda cv: (
+            cv['cv_folds'] >= 2
+            and cv['scoring'] in ['neg_mean_squared_error', 'r2', 'neg_mean_absolute_error']
+        ),
+        id="cross_validation",
+    ),
+    pytest.param(
+        {
+            'data_source': 'csv',
+            'target_column': 'target',
+            'feature_columns': ['feature_1', 'feature_2', 'feature_3'],
+            'test_size': 0.2,
+            'validation_size': 0.1,
+            'random_state': 42
+        },
+        {'data_source': str, 'target_column': str, 'feature_columns': list, 'test_size': float, 'validation_size': float},
+        lambda pipeline: (
+            pipeline['data_source'] in ['csv', 'json', 'parquet', 'database']
+            and 0 < pipeline['test_size'] < 1 and 0 < pipeline['validation_size'] < 1
+            and pipeline['test_size'] + pipeline['validation_size'] < 1
+        ),
+        id="data_pipeline",
+    ),
+]
+
+
+@pytest.mark.parametrize("sample, schema, check", SCHEMA_CASES)
+def test_schema_shapes(sample, schema, check):
+    """Test payload and configuration dicts carry the expected keys and types"""
+    for key, expected_type in schema.items():
+        assert key in sample
+        assert isinstance(sample[key], expected_type)
+    assert check(sample)
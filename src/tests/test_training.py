@@ -7,10 +7,46 @@ import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.linear_model import LinearRegression
-from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.metrics import mean_squared_error, r2_score, confusion_matrix, precision_recall_fscore_support
 import joblib
-import tempfile
-import os
+import io
+
+from sklearn.preprocessing import StandardScaler
+
+import _kernels
+import train
+from train import MLTrainingPipeline
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:  # numba is optional; the kernel then runs as plain Python
+    numba = None
+    prange = range
+
+    def njit(*args, **kwargs):
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True, parallel=True, fastmath=True)
+def _standardize(X):
+    """Scale each column to zero mean and unit variance in one fused kernel"""
+    n_rows, n_cols = X.shape
+    X_scaled = np.empty_like(X)
+    for j in prange(n_cols):
+        # Welford's running mean/variance, then a single write pass
+        mean = 0.0
+        m2 = 0.0
+        for i in range(n_rows):
+            delta = X[i, j] - mean
+            mean += delta / (i + 1)
+            m2 += delta * (X[i, j] - mean)
+        std = np.sqrt(m2 / n_rows)
+        for i in range(n_rows):
+            X_scaled[i, j] = (X[i, j] - mean) / std
+    return X_scaled
 
 
 def test_data_preprocessing():
@@ -29,28 +65,106 @@ def test_data_preprocessing():
     assert df.isnull().sum().sum() == 0  # No missing values
 
 
-def test_feature_engineering():
+def test_feature_engineering(rng):
     """Test feature engineering logic"""
-    # Create sample data
-    np.random.seed(42)
-    X = np.random.randn(100, 3)
-    y = X[:, 0] + 2 * X[:, 1] + 0.5 * X[:, 2] + np.random.randn(100) * 0.1
+    # Create sample data (float64: the tolerances below are tighter than float32)
+    X = rng.standard_normal((100, 3))
+    y = X[:, 0] + 2 * X[:, 1] + 0.5 * X[:, 2] + rng.standard_normal(100) * 0.1
     
     # Test feature scaling
-    X_mean = np.mean(X, axis=0)
-    X_std = np.std(X, axis=0)
-    X_scaled = (X - X_mean) / X_std
+    X_scaled = _standardize(X)
     
     assert np.allclose(np.mean(X_scaled, axis=0), 0, atol=1e-10)
     assert np.allclose(np.std(X_scaled, axis=0), 1, atol=1e-10)
 
 
-def test_model_training():
+@pytest.mark.skipif(numba is None or numba.config.DISABLE_JIT, reason="needs numba with JIT enabled")
+def test_standardize_jit(rng):
+    """Test the scaling kernel compiles and matches NumPy"""
+    X = rng.standard_normal((100, 3))
+    
+    X_scaled = _standardize(X)
+    
+    assert _standardize.signatures
+    assert np.allclose(X_scaled, (X - X.mean(axis=0)) / X.std(axis=0))
+
+
+@pytest.fixture
+def features_with_gaps(rng):
+    """float32 features with scattered NaNs and a constant column"""
+    X = rng.standard_normal((200, 4)).astype(np.float32) * np.array([1, 3, 0.5, 1], dtype=np.float32)
+    X[:, 3] = 2.5
+    X[rng.integers(0, 200, 30), 0] = np.nan
+    X[rng.integers(0, 200, 10), 2] = np.nan
+    return X
+
+
+@pytest.mark.parametrize("kernel", [
+    _kernels.nan_impute_and_scale,
+    _kernels._nan_impute_and_scale_numpy,
+])
+def test_nan_impute_and_scale(kernel, features_with_gaps):
+    """Test imputing and scaling matches StandardScaler on mean-filled data"""
+    frame = pd.DataFrame(features_with_gaps)
+    X_filled = frame.fillna(frame.mean())
+    scaler = StandardScaler().fit(X_filled)
+    expected = scaler.transform(X_filled)
+    
+    X = features_with_gaps.copy()
+    mean, var, scale = kernel(X)
+    
+    assert X.dtype == np.float32
+    assert np.allclose(mean, scaler.mean_, atol=1e-6)
+    assert np.allclose(var, scaler.var_, atol=1e-6)
+    assert np.allclose(scale, scaler.scale_, atol=1e-6)
+    assert np.allclose(X, expected, atol=1e-5)
+    assert np.all(X[:, 3] == 0.0)
+
+
+@pytest.mark.parametrize("kernel", [
+    _kernels.sum_positive_label,
+    _kernels._sum_positive_label_numpy,
+])
+def test_sum_positive_label(kernel, rng):
+    """Test synthetic labels on the strided feature view of the data array"""
+    data = np.empty((100, 6), dtype=np.float32)
+    data[:, :-1] = rng.standard_normal((100, 5))
+    X = data[:, :-1]
+    
+    labels = kernel(X)
+    
+    assert labels.dtype == np.int8
+    assert np.array_equal(labels, (X.astype(np.float64).sum(axis=1) > 0).astype(np.int8))
+
+
+@pytest.mark.skipif(numba is None or numba.config.DISABLE_JIT, reason="needs numba with JIT enabled")
+def test_training_kernels_jit(features_with_gaps, rng):
+    """Test the kernels warmed in the training image compile and match NumPy"""
+    _kernels.warm_up()
+    assert _kernels.nan_impute_and_scale.signatures
+    assert _kernels.sum_positive_label.signatures
+    
+    X_jit, X_numpy = features_with_gaps.copy(), features_with_gaps.copy()
+    for jit_stat, numpy_stat in zip(
+        _kernels.nan_impute_and_scale(X_jit),
+        _kernels._nan_impute_and_scale_numpy(X_numpy)
+    ):
+        assert np.allclose(jit_stat, numpy_stat)
+    assert np.allclose(X_jit, X_numpy, atol=1e-5)
+    
+    data = np.empty((100, 6), dtype=np.float32)
+    data[:, :-1] = rng.standard_normal((100, 5))
+    assert np.array_equal(
+        _kernels.sum_positive_label(data[:, :-1]),
+        _kernels._sum_positive_label_numpy(data[:, :-1])
+    )
+
+
+def test_model_training(rng):
     """Test model training pipeline"""
     # Generate sample data
-    np.random.seed(42)
-    X = np.random.randn(100, 4)
-    y = X[:, 0] + 2 * X[:, 1] - X[:, 2] + 0.5 * X[:, 3] + np.random.randn(100) * 0.1
+    X = rng.standard_normal((100, 4), dtype=np.float32)
+    y = X[:, 0] + 2 * X[:, 1] - X[:, 2] + 0.5 * X[:, 3] + rng.standard_normal(100, dtype=np.float32) * 0.1
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(
@@ -73,67 +187,80 @@ def test_model_training():
     assert len(y_pred) == len(y_test)
 
 
-def test_model_serialization():
+def test_model_serialization(rng):
     """Test model saving and loading"""
     # Create and train a simple model
-    np.random.seed(42)
-    X = np.random.randn(50, 2)
-    y = X[:, 0] + X[:, 1] + np.random.randn(50) * 0.1
+    X = rng.standard_normal((50, 2), dtype=np.float32)
+    y = X[:, 0] + X[:, 1] + rng.standard_normal(50, dtype=np.float32) * 0.1
     
     model = LinearRegression()
     model.fit(X, y)
     
-    # Test serialization
-    with tempfile.NamedTemporaryFile(suffix='.joblib', delete=False) as tmp_file:
-        try:
-            # Save model
-            joblib.dump(model, tmp_file.name)
-            
-            # Load model
-            loaded_model = joblib.load(tmp_file.name)
-            
-            # Test predictions are identical
-            test_X = np.random.randn(5, 2)
-            original_pred = model.predict(test_X)
-            loaded_pred = loaded_model.predict(test_X)
-            
-            assert np.allclose(original_pred, loaded_pred)
-            
-        finally:
-            # Clean up
-            if os.path.exists(tmp_file.name):
-                os.unlink(tmp_file.name)
-
-
-def test_hyperparameter_validation():
-    """Test hyperparameter validation"""
-    hyperparams = {
-        'learning_rate': 0.01,
-        'max_depth': 6,
-        'n_estimators': 100,
-        'random_state': 42
-    }
+    # Test serialization, round-tripping in memory
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    buffer.seek(0)
+    loaded_model = joblib.load(buffer)
+    
+    # Test predictions are identical
+    test_X = rng.standard_normal((5, 2), dtype=np.float32)
+    original_pred = model.predict(test_X)
+    loaded_pred = loaded_model.predict(test_X)
     
-    # Validate hyperparameter ranges
-    assert 0 < hyperparams['learning_rate'] <= 1
-    assert hyperparams['max_depth'] > 0
-    assert hyperparams['n_estimators'] > 0
-    assert isinstance(hyperparams['random_state'], int)
+    assert np.allclose(original_pred, loaded_pred)
 
 
-def test_cross_validation_setup():
-    """Test cross-validation configuration"""
-    cv_config = {
-        'cv_folds': 5,
-        'scoring': 'neg_mean_squared_error',
-        'shuffle': True,
-        'random_state': 42
-    }
+@pytest.fixture
+def pipeline(tmp_path):
+    """Training pipeline writing everything under a temporary directory"""
+    return MLTrainingPipeline({
+        'data_path': str(tmp_path / 'data'),
+        'model_output_path': str(tmp_path / 'models'),
+        'artifacts_path': str(tmp_path / 'artifacts')
+    })
+
+
+def test_synthetic_data_cache(pipeline):
+    """Test the synthetic data cache is written atomically and rebuilt if corrupt"""
+    X, y = pipeline._generate_synthetic_data()
+    cache_files = list(pipeline.data_dir.iterdir())
+    assert len(cache_files) == 1
+    assert cache_files[0].suffix == '.npy'
     
-    assert cv_config['cv_folds'] >= 2
-    assert cv_config['scoring'] in ['neg_mean_squared_error', 'r2', 'neg_mean_absolute_error']
-    assert isinstance(cv_config['shuffle'], bool)
-    assert isinstance(cv_config['random_state'], int)
+    # A truncated cache, as an interrupted run could once leave, is regenerated
+    cache_path = cache_files[0]
+    cache_path.write_bytes(cache_path.read_bytes()[:200])
+    X_rebuilt, y_rebuilt = pipeline._generate_synthetic_data()
+    assert np.array_equal(X_rebuilt.to_numpy(), X.to_numpy())
+    assert np.array_equal(y_rebuilt.to_numpy(), y.to_numpy())
+    assert np.load(cache_path).shape == (len(X), X.shape[1] + 1)
+    assert list(pipeline.data_dir.iterdir()) == [cache_path]
+
+
+def test_evaluate_model_generalization_score(pipeline, rng, monkeypatch):
+    """Test OOB scores leave the spread unmeasured and GPU configs cross-validate serially"""
+    X = rng.standard_normal((120, 4)).astype(np.float32)
+    y = (X[:, 0] > 0).astype(np.int8)
+    
+    pipeline.config['model_params'] = {'n_estimators': 20, 'random_state': 42}
+    pipeline.train_model(X, y)
+    metrics = pipeline.evaluate_model(X, y)
+    assert metrics['cv_mean_score'] == pipeline.model.oob_score_
+    assert metrics['cv_std_score'] is None
+    
+    n_jobs = []
+    
+    def fake_cross_val_score(*args, **kwargs):
+        n_jobs.append(kwargs['n_jobs'])
+        return np.array([0.5, 0.6, 0.7])
+    
+    monkeypatch.setattr(train, 'cross_val_score', fake_cross_val_score)
+    pipeline.config['model_params'] = {'n_estimators': 20, 'random_state': 42, 'bootstrap': False}
+    pipeline.train_model(X, y)
+    pipeline.evaluate_model(X, y)
+    pipeline.config['gpu_backend'] = 'xgboost'
+    pipeline.evaluate_model(X, y)
+    assert n_jobs == [-1, 1]
 
 
 def test_metrics_calculation():
@@ -154,21 +281,31 @@ def test_metrics_calculation():
     assert len(y_true) == len(y_pred)
 
 
-def test_data_pipeline_config():
-    """Test data pipeline configuration"""
-    pipeline_config = {
-        'data_source': 'csv',
-        'target_column': 'target',
-        'feature_columns': ['feature_1', 'feature_2', 'feature_3'],
-        'test_size': 0.2,
-        'validation_size': 0.1,
-        'random_state': 42
-    }
+@pytest.mark.parametrize("n_classes, average", [(2, 'binary'), (4, 'macro')])
+def test_classification_summary(n_classes, average, rng):
+    """Test the confusion-matrix summary matches scikit-learn"""
+    y_true = rng.integers(0, n_classes, 300)
+    y_pred = rng.integers(0, n_classes, 300)
+    # Never predict one class, so its precision is undefined and counts as 0
+    y_pred[y_pred == n_classes - 1] = 0
+    
+    cm = confusion_matrix(y_true, y_pred)
+    summary = MLTrainingPipeline._classification_summary(cm)
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        y_true, y_pred, average=average, zero_division=0
+    )
+    
+    assert summary == pytest.approx({'precision': precision, 'recall': recall, 'f1': f1})
+
+
+@pytest.mark.parametrize("y_true, y_pred", [
+    (np.array([0, 1, 1, 0, 1], dtype=np.int8), np.array([0, 1, 0, 0, 1], dtype=np.int8)),
+    # Non-0/1 labels, with 9 appearing only in the predictions
+    (np.array([3, 7, 7, 5, 3, 5]), np.array([3, 9, 7, 5, 5, 9])),
+    (np.array(['cat', 'dog', 'dog']), np.array(['dog', 'dog', 'emu'])),
+])
+def test_confusion_matrix(y_true, y_pred):
+    """Test the bincount confusion matrix matches scikit-learn"""
+    cm = MLTrainingPipeline._confusion_matrix(y_true, y_pred)
     
-    # Validate configuration
-    assert pipeline_config['data_source'] in ['csv', 'json', 'parquet', 'database']
-    assert isinstance(pipeline_config['target_column'], str)
-    assert isinstance(pipeline_config['feature_columns'], list)
-    assert 0 < pipeline_config['test_size'] < 1
-    assert 0 < pipeline_config['validation_size'] < 1
-    assert pipeline_config['test_size'] + pipeline_config['validation_size'] < 1
+    assert np.array_equal(cm, confusion_matrix(y_true, y_pred))
@@ -0,0 +1,109 @@
+"""
+Numba kernels for the ML training pipeline
+
+train.py imports this module lazily, inside the methods that need it, so
+loading the pipeline doesn't pay numba's import and compile cost. Kernels
+are compiled with cache=True; the training image warms the cache at build
+time via warm_up(). Without numba, NumPy implementations with the same
+signatures are used instead.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional
+    njit = None
+
+
+def _nan_impute_and_scale(X):
+    """Mean-impute NaN and standardize float32 X in place
+
+    Returns (mean, var, scale) per column as float64, matching what
+    StandardScaler would learn from the mean-imputed data.
+    """
+    n_rows, n_cols = X.shape
+    sums = np.zeros(n_cols)
+    counts = np.zeros(n_cols)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            value = X[i, j]
+            if not np.isnan(value):
+                sums[j] += value
+                counts[j] += 1
+
+    mean = np.empty(n_cols)
+    for j in range(n_cols):
+        mean[j] = sums[j] / counts[j] if counts[j] > 0 else np.nan
+
+    # Imputed entries sit exactly on the mean, so they add nothing to the
+    # sum of squares but still count towards n_rows
+    squares = np.zeros(n_cols)
+    for i in range(n_rows):
+        for j in range(n_cols):
+            value = X[i, j]
+            if not np.isnan(value):
+                delta = value - mean[j]
+                squares[j] += delta * delta
+
+    var = squares / n_rows
+    scale = np.sqrt(var)
+    for j in range(n_cols):
+        if scale[j] == 0.0:
+            scale[j] = 1.0
+
+    for i in range(n_rows):
+        for j in range(n_cols):
+            value = X[i, j]
+            if np.isnan(value):
+                X[i, j] = 0.0
+            else:
+                X[i, j] = (value - mean[j]) / scale[j]
+    return mean, var, scale
+
+
+def _sum_positive_label(X):
+    """Label each row 1 if its features sum above zero, else 0"""
+    n_rows, n_cols = X.shape
+    labels = np.empty(n_rows, dtype=np.int8)
+    for i in range(n_rows):
+        total = 0.0
+        for j in range(n_cols):
+            total += X[i, j]
+        labels[i] = 1 if total > 0.0 else 0
+    return labels
+
+
+def _nan_impute_and_scale_numpy(X):
+    mean = np.nanmean(X, axis=0, dtype=np.float64)
+    np.subtract(X, mean, out=X, casting='unsafe')
+    var = np.nansum(np.square(X, dtype=np.float64), axis=0) / X.shape[0]
+    scale = np.sqrt(var)
+    scale[scale == 0.0] = 1.0
+    np.divide(X, scale, out=X, casting='unsafe')
+    np.nan_to_num(X, copy=False, nan=0.0)
+    return mean, var, scale
+
+
+def _sum_positive_label_numpy(X):
+    return (X.sum(axis=1, dtype=np.float64) > 0).astype(np.int8)
+
+
+if njit is not None:
+    # No fastmath on the imputer: it would let the compiler assume no NaNs
+    nan_impute_and_scale = njit(cache=True)(_nan_impute_and_scale)
+    sum_positive_label = njit(cache=True, fastmath=True)(_sum_positive_label)
+else:
+    nan_impute_and_scale = _nan_impute_and_scale_numpy
+    sum_positive_label = _sum_positive_label_numpy
+
+
+def warm_up():
+    """Compile the kernels for the array layouts the pipeline passes in"""
+    nan_impute_and_scale(np.zeros((2, 2), dtype=np.float32))
+    # _generate_synthetic_data passes a strided view of a wider array
+    sum_positive_label(np.zeros((2, 3), dtype=np.float32)[:, :-1])
+
+
+if __name__ == "__main__":
+    warm_up()
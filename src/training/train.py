@@ -4,23 +4,28 @@ Handles model training, validation, and deployment
 """
 
 import os
+import copy
 import json
 import time
+import functools
+import tempfile
 import logging
+import importlib.util
 from pathlib import Path
 from typing import Dict, Any, Tuple, Optional
 import argparse
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import cross_val_score, StratifiedKFold, StratifiedShuffleSplit
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from sklearn.preprocessing import StandardScaler
 import joblib
-import mlflow
-import mlflow.sklearn
-from mlflow.tracking import MlflowClient
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is the fallback
+    orjson = None
 
 # Configure logging
 logging.basicConfig(
@@ -30,6 +35,36 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def _json_default(obj: Any) -> Any:
+    """Fallback encoder for numpy values"""
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _dump_json(obj: Any, path: Path) -> None:
+    """Write obj to path as indented JSON"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(
+                obj,
+                default=_json_default,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+            ))
+    else:
+        with open(path, 'w') as f:
+            json.dump(obj, f, indent=2, default=_json_default)
+
+
+def _load_json(path: str) -> Any:
+    """Read a JSON document from path"""
+    if orjson is not None:
+        with open(path, 'rb') as f:
+            return orjson.loads(f.read())
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
 class MLTrainingPipeline:
     """ML Training Pipeline for enterprise deployment"""
     
@@ -39,8 +74,9 @@ class MLTrainingPipeline:
         self.scaler = None
         self.metrics = {}
         
-        # Initialize MLflow
+        # Initialize MLflow; imported here since most runs don't track
         if config.get('mlflow_tracking_uri'):
+            import mlflow
             mlflow.set_tracking_uri(config['mlflow_tracking_uri'])
         
         # Create directories
@@ -64,7 +100,12 @@ class MLTrainingPipeline:
             return self._generate_synthetic_data()
         
         try:
-            df = pd.read_csv(data_file)
+            # The pyarrow engine parses with a multithreaded C++ reader;
+            # fall back to pandas' C engine when pyarrow isn't installed
+            if importlib.util.find_spec('pyarrow') is not None:
+                df = pd.read_csv(data_file, engine='pyarrow')
+            else:
+                df = pd.read_csv(data_file)
             
             # Assume last column is target
             X = df.iloc[:, :-1]
@@ -78,21 +119,58 @@ class MLTrainingPipeline:
             raise
     
     def _generate_synthetic_data(self) -> Tuple[pd.DataFrame, pd.Series]:
-        """Generate synthetic data for demonstration"""
-        np.random.seed(42)
+        """Generate synthetic data for demonstration
+        
+        The array is cached in data_dir; the file name encodes the generator
+        version, seed and shape so changing any of them regenerates it.
+        """
+        seed = 42
         n_samples = 1000
         n_features = 10
+        columns = [f'feature_{i}' for i in range(n_features)]
+        cache_path = self.data_dir / f'synthetic_v2_seed{seed}_n{n_samples}_f{n_features}.npy'
+        
+        if cache_path.exists():
+            # Features plus target as the last column, memory-mapped read-only
+            try:
+                data = np.load(cache_path, mmap_mode='r')
+                if data.shape != (n_samples, n_features + 1) or data.dtype != np.float32:
+                    raise ValueError(f"unexpected array {data.dtype}{data.shape}")
+            except (OSError, ValueError, EOFError) as e:
+                logger.warning(f"Ignoring unreadable synthetic data cache {cache_path}: {e}")
+            else:
+                X = pd.DataFrame(data[:, :-1], columns=columns, copy=False)
+                y = pd.Series(data[:, -1].astype(np.int8), name='target', copy=False)
+                logger.info(f"Loaded cached synthetic data from {cache_path}")
+                return X, y
         
-        X = pd.DataFrame(
-            np.random.randn(n_samples, n_features),
-            columns=[f'feature_{i}' for i in range(n_features)]
-        )
+        rng = np.random.default_rng(seed)
+        data = np.empty((n_samples, n_features + 1), dtype=np.float32)
+        X_arr = data[:, :-1]
+        X_arr[:] = rng.standard_normal((n_samples, n_features), dtype=np.float32)
         
-        # Create synthetic target with some correlation to features
-        y = pd.Series(
-            (X.sum(axis=1) > 0).astype(int),
-            name='target'
-        )
+        # Create synthetic target with some correlation to features; computed
+        # on the raw array so pandas never materializes the row sums
+        from _kernels import sum_positive_label
+        y_arr = sum_positive_label(X_arr)
+        data[:, -1] = y_arr
+        
+        # Write to a temporary file and rename it into place, so an
+        # interrupted or concurrent run never leaves a truncated cache
+        tmp_path = None
+        try:
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.data_dir, suffix='.npy.tmp', delete=False) as f:
+                tmp_path = f.name
+                np.save(f, data)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            logger.warning(f"Could not cache synthetic data to {cache_path}: {e}")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        
+        X = pd.DataFrame(X_arr, columns=columns, copy=False)
+        y = pd.Series(y_arr, name='target', copy=False)
         
         logger.info(f"Generated synthetic data: {X.shape[0]} samples, {X.shape[1]} features")
         return X, y
@@ -101,15 +179,32 @@ class MLTrainingPipeline:
         """Preprocess the data"""
         logger.info("Preprocessing data")
         
-        # Handle missing values
-        X_clean = X.fillna(X.mean())
+        # Impute and scale in place on a single float32 copy. Filling NaN
+        # with the column mean and then standardizing is the same as
+        # standardizing the observed values and mapping NaN to 0.
+        from _kernels import nan_impute_and_scale
+        X_scaled = np.array(X, dtype=np.float32, order='C')
+        n_samples = X_scaled.shape[0]
+        mean, var, scale = nan_impute_and_scale(X_scaled)
         
-        # Scale features
+        # Keep a fitted StandardScaler as the saved preprocessing artifact
         self.scaler = StandardScaler()
-        X_scaled = self.scaler.fit_transform(X_clean)
+        self.scaler.mean_ = mean
+        self.scaler.var_ = var
+        self.scaler.scale_ = scale
+        self.scaler.n_samples_seen_ = n_samples
+        self.scaler.n_features_in_ = X_scaled.shape[1]
+        if hasattr(X, 'columns'):
+            self.scaler.feature_names_in_ = np.asarray(X.columns, dtype=object)
+        
+        # Class labels fit in int8 for the binary/small-multiclass targets
+        # this pipeline trains on; anything wider is left as loaded
+        y_arr = y.to_numpy()
+        if y_arr.dtype.kind in 'iu' and y_arr.size and y_arr.min() >= -128 and y_arr.max() <= 127:
+            y_arr = y_arr.astype(np.int8, copy=False)
         
         logger.info("Data preprocessing completed")
-        return X_scaled, y.values
+        return X_scaled, y_arr
     
     def train_model(self, X_train: np.ndarray, y_train: np.ndarray) -> None:
         """Train the ML model"""
@@ -123,7 +218,7 @@ class MLTrainingPipeline:
         })
         
         # Initialize model
-        self.model = RandomForestClassifier(**model_params)
+        self.model = self._make_model(model_params)
         
         # Train model
         start_time = time.time()
@@ -131,28 +226,70 @@ class MLTrainingPipeline:
         training_time = time.time() - start_time
         
         self.metrics['training_time'] = training_time
+        self.metrics['n_classes'] = int(len(self.model.classes_))
         logger.info(f"Model training completed in {training_time:.2f} seconds")
     
+    def _make_model(self, model_params: Dict[str, Any]) -> Any:
+        """Create the classifier, using a GPU implementation when one is available
+        
+        cuML's RandomForestClassifier is used whenever RAPIDS is installed.
+        XGBoost on CUDA is opt-in via config 'gpu_backend': 'xgboost', since
+        having the package installed doesn't imply a GPU is present.
+        Otherwise scikit-learn's RandomForestClassifier runs on CPU.
+        """
+        if importlib.util.find_spec('cuml') is not None:
+            from cuml.ensemble import RandomForestClassifier as CumlRandomForestClassifier
+            logger.info("Using cuML RandomForestClassifier on GPU")
+            return CumlRandomForestClassifier(**model_params)
+        
+        if self.config.get('gpu_backend') == 'xgboost' and importlib.util.find_spec('xgboost') is not None:
+            from xgboost import XGBClassifier
+            logger.info("Using XGBoost on GPU")
+            return XGBClassifier(**{**model_params, 'tree_method': 'hist', 'device': 'cuda'})
+        
+        # Out-of-bag scoring gives evaluate_model a generalization estimate
+        # without refitting the forest for cross-validation
+        params = dict(model_params)
+        if params.get('bootstrap', True):
+            params.setdefault('oob_score', True)
+        return RandomForestClassifier(**params)
+    
     def evaluate_model(self, X_test: np.ndarray, y_test: np.ndarray) -> Dict[str, Any]:
         """Evaluate the trained model"""
         logger.info("Evaluating model")
         
         # Make predictions
         y_pred = self.model.predict(X_test)
-        y_pred_proba = self.model.predict_proba(X_test)
         
         # Calculate metrics
-        accuracy = accuracy_score(y_test, y_pred)
+        accuracy = float(np.mean(y_test == y_pred))
+        
+        # Generalization score: reuse the out-of-bag estimate when the model
+        # has one, otherwise cross-validate. The OOB estimate is a single
+        # number, so its spread is left unmeasured (None) rather than 0.
+        if getattr(self.model, 'oob_score_', None) is not None:
+            cv_mean_score = self.model.oob_score_
+            cv_std_score = None
+        else:
+            # GPU models share one device; a process per CPU would only
+            # contend for it
+            on_gpu = bool(self.config.get('gpu_backend')) or type(self.model).__module__.startswith('cuml')
+            cv_scores = cross_val_score(
+                self.model, X_test, y_test,
+                cv=StratifiedKFold(n_splits=3, shuffle=True, random_state=42),
+                n_jobs=1 if on_gpu else -1
+            )
+            cv_mean_score = cv_scores.mean()
+            cv_std_score = cv_scores.std()
         
-        # Cross-validation score
-        cv_scores = cross_val_score(self.model, X_test, y_test, cv=5)
+        cm = self._confusion_matrix(y_test, y_pred)
         
         evaluation_metrics = {
             'accuracy': accuracy,
-            'cv_mean_score': cv_scores.mean(),
-            'cv_std_score': cv_scores.std(),
-            'classification_report': classification_report(y_test, y_pred, output_dict=True),
-            'confusion_matrix': confusion_matrix(y_test, y_pred).tolist()
+            'cv_mean_score': cv_mean_score,
+            'cv_std_score': cv_std_score,
+            'classification_summary': self._classification_summary(cm),
+            'confusion_matrix': cm.tolist()
         }
         
         self.metrics.update(evaluation_metrics)
@@ -160,17 +297,46 @@ class MLTrainingPipeline:
         logger.info(f"Model evaluation completed. Accuracy: {accuracy:.4f}")
         return evaluation_metrics
     
+    @staticmethod
+    def _confusion_matrix(y_true: np.ndarray, y_pred: np.ndarray) -> np.ndarray:
+        """Confusion matrix over the sorted union of labels, as sklearn builds it"""
+        labels, codes = np.unique(np.concatenate((y_true, y_pred)), return_inverse=True)
+        n_labels = len(labels)
+        true_codes, pred_codes = codes[:len(y_true)], codes[len(y_true):]
+        counts = np.bincount(true_codes * n_labels + pred_codes, minlength=n_labels * n_labels)
+        return counts.reshape(n_labels, n_labels)
+    
+    @staticmethod
+    def _classification_summary(cm: np.ndarray) -> Dict[str, float]:
+        """Precision, recall and F1 derived from a confusion matrix
+        
+        Binary problems report the positive class, multiclass problems the
+        macro average. Undefined ratios count as 0.
+        """
+        tp = np.diag(cm).astype(np.float64)
+        predicted = cm.sum(axis=0)
+        actual = cm.sum(axis=1)
+        precision = np.divide(tp, predicted, out=np.zeros_like(tp), where=predicted > 0)
+        recall = np.divide(tp, actual, out=np.zeros_like(tp), where=actual > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros_like(tp), where=(precision + recall) > 0)
+        
+        if cm.shape[0] == 2:
+            return {'precision': float(precision[1]), 'recall': float(recall[1]), 'f1': float(f1[1])}
+        return {'precision': float(precision.mean()), 'recall': float(recall.mean()), 'f1': float(f1.mean())}
+    
     def save_model(self, model_name: str = "production_model") -> None:
         """Save the trained model and artifacts"""
         logger.info(f"Saving model: {model_name}")
         
-        # Save model
+        # Save model. Uncompressed files let the API memory-map the model's
+        # arrays; set 'compress_model' to trade that for smaller artifacts.
         model_path = self.model_dir / f"{model_name}.pkl"
-        joblib.dump(self.model, model_path)
+        joblib.dump(self.model, model_path, compress=self._model_compression(), protocol=5)
         
         # Save scaler
         scaler_path = self.model_dir / f"{model_name}_scaler.pkl"
-        joblib.dump(self.scaler, scaler_path)
+        joblib.dump(self.scaler, scaler_path, compress=0, protocol=5)
         
         # Save metadata
         metadata = {
@@ -181,30 +347,45 @@ class MLTrainingPipeline:
             'metrics': self.metrics,
             'config': self.config,
             'input_shape': self.scaler.n_features_in_,
-            'output_shape': len(np.unique(self.metrics.get('y_true', [0, 1])))
+            'output_shape': self.metrics.get('n_classes', 1)
         }
         
         metadata_path = self.model_dir / f"{model_name}_metadata.json"
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        _dump_json(metadata, metadata_path)
         
         logger.info(f"Model saved to {model_path}")
         logger.info(f"Metadata saved to {metadata_path}")
     
+    def _model_compression(self) -> Any:
+        """joblib compression setting for the saved model"""
+        if not self.config.get('compress_model'):
+            return 0
+        if importlib.util.find_spec('lz4') is not None:
+            return ('lz4', 1)
+        return ('zlib', 1)
+    
     def log_to_mlflow(self, model_name: str = "production_model") -> None:
         """Log training run to MLflow"""
         logger.info("Logging to MLflow")
         
-        with mlflow.start_run():
-            # Log parameters
+        import mlflow
+        import mlflow.sklearn
+        from mlflow.entities import Metric, Param
+        from mlflow.tracking import MlflowClient
+        
+        with mlflow.start_run() as run:
+            # Log parameters and metrics in a single tracking server request
             model_params = self.config.get('model_params', {})
-            for param, value in model_params.items():
-                mlflow.log_param(param, value)
+            params = [Param(param, str(value)) for param, value in model_params.items()]
+            
+            timestamp = int(time.time() * 1000)
+            metrics = [
+                Metric(metric, float(value), timestamp, 0)
+                for metric, value in self.metrics.items()
+                if isinstance(value, (int, float))
+            ]
             
-            # Log metrics
-            for metric, value in self.metrics.items():
-                if isinstance(value, (int, float)):
-                    mlflow.log_metric(metric, value)
+            MlflowClient().log_batch(run.info.run_id, metrics=metrics, params=params)
             
             # Log model
             mlflow.sklearn.log_model(
@@ -229,13 +410,11 @@ class MLTrainingPipeline:
             # Preprocess data
             X_processed, y_processed = self.preprocess_data(X, y)
             
-            # Split data
-            X_train, X_test, y_train, y_test = train_test_split(
-                X_processed, y_processed,
-                test_size=0.2,
-                random_state=42,
-                stratify=y_processed
-            )
+            # Split data: stratified indices, then one gather per array
+            splitter = StratifiedShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+            train_idx, test_idx = next(splitter.split(X_processed, y_processed))
+            X_train, X_test = X_processed[train_idx], X_processed[test_idx]
+            y_train, y_test = y_processed[train_idx], y_processed[test_idx]
             
             # Train model
             self.train_model(X_train, y_train)
@@ -265,11 +444,18 @@ class MLTrainingPipeline:
             }
 
 
+@functools.lru_cache(maxsize=8)
+def _load_config_file(config_path: str, mtime_ns: int) -> Dict[str, Any]:
+    """Parse a config file; mtime_ns is part of the key so edits are re-read"""
+    return _load_json(config_path)
+
+
 def load_config(config_path: str) -> Dict[str, Any]:
     """Load training configuration"""
     if os.path.exists(config_path):
-        with open(config_path, 'r') as f:
-            return json.load(f)
+        # Callers mutate the config, so each gets its own copy of the cached one
+        config = _load_config_file(config_path, os.stat(config_path).st_mtime_ns)
+        return copy.deepcopy(config)
     
     # Default configuration
     return {